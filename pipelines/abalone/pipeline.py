@@ -1,25 +1,29 @@
 """Example workflow pipeline script for hmda pipeline.
                                                                                  . -ModelStep
                                                                                 .
-    Process-> DataQualityCheck/DataBiasCheck -> Train -> Evaluate -> Condition .
-                                                  |                              .
-                                                  |                                . -(stop)
-                                                  |
-                                                   -> CreateModel-> ModelBiasCheck/ModelExplainabilityCheck
-                                                           |
-                                                           |
-                                                            -> BatchTransform -> ModelQualityCheck
+    Process-> Train ------------------------------------------> Evaluate -> Condition .
+        |       |                                                                  .
+        |       |                                                                    . -(stop)
+        |       |
+        |        -> CreateModel-> ModelBiasCheck/ModelExplainabilityCheck
+        |                |
+        |                |
+        |                 -> BatchTransform -> ModelQualityCheck
+        |
+         -> DataQualityCheck/DataBiasCheck (in parallel with Train)
 
 Implements a get_pipeline(**kwargs) method.
 """
+import functools
 import os
 
 import boto3
 import sagemaker
 import sagemaker.session
+from botocore.config import Config
 
 from sagemaker.estimator import Estimator
-from sagemaker.inputs import TrainingInput, CreateModelInput, TransformInput
+from sagemaker.inputs import TrainingInput, TransformInput
 from sagemaker.model import Model
 from sagemaker.transformer import Transformer
 
@@ -27,8 +31,7 @@ from sagemaker.workflow.automl_step import AutoMLStep
 from sagemaker import (
     AutoML,
     AutoMLInput,
-    get_execution_role,
-    ModelPackage
+    image_uris,
 )
 
 from sagemaker.model_metrics import (
@@ -42,7 +45,7 @@ from sagemaker.processing import (
     ProcessingOutput,
     ScriptProcessor,
 )
-from sagemaker.sklearn.processing import SKLearnProcessor
+from sagemaker.workflow import is_pipeline_variable
 from sagemaker.workflow.conditions import ConditionGreaterThanOrEqualTo
 from sagemaker.workflow.condition_step import (
     ConditionStep,
@@ -58,12 +61,11 @@ from sagemaker.workflow.parameters import (
 from sagemaker.workflow.pipeline import Pipeline
 from sagemaker.workflow.properties import PropertyFile
 from sagemaker.workflow.steps import (
+    CacheConfig,
     ProcessingStep,
     TrainingStep,
-    CreateModelStep,
     TransformStep
 )
-from sagemaker.workflow.step_collections import RegisterModel
 from sagemaker.workflow.check_job_config import CheckJobConfig
 from sagemaker.workflow.clarify_check_step import (
     DataBiasCheckConfig,
@@ -80,87 +82,216 @@ from sagemaker.workflow.quality_check_step import (
 )
 from sagemaker.workflow.execution_variables import ExecutionVariables
 from sagemaker.workflow.functions import Join
-from sagemaker.model_monitor import DatasetFormat, model_monitoring
+from sagemaker.model_monitor import DatasetFormat
 from sagemaker.clarify import (
     BiasConfig,
     DataConfig,
     ModelConfig
 )
 from sagemaker.workflow.model_step import ModelStep
-from sagemaker.model import Model
 from sagemaker.workflow.pipeline_context import PipelineSession
 
 
 BASE_DIR = os.path.dirname(os.path.realpath(__file__))
 
+# columns of the `train_no_header` output of preprocess.py, label first
+_HMDA_HEADERS = (
+    "action_taken", "conforming_loan_limit", "derived_sex", "preapproval", "loan_type", "loan_purpose",
+    "lien_status", "reverse_mortgage", "open-end_line_of_credit", "business_or_commercial_purpose", "loan_amount",
+    "loan_to_value_ratio", "loan_term", "negative_amortization", "interest_only_payment", "balloon_payment",
+    "other_nonamortizing_features", "property_value", "construction_method", "occupancy_type", "total_units", "income",
+    "debt_to_income_ratio", "derived_age_above_62", "derived_age_below_25", "derived_race_revisited",
+    "if_co-applicant",
+)
+
+# (key, parameter name prefix, whether a baseline statistics file can be supplied) of each check step;
+# the quality checks take statistics and constraints, the Clarify checks only constraints
+_CHECK_KINDS = (
+    ("data_quality", "DataQuality", True),
+    ("data_bias", "DataBias", False),
+    ("model_quality", "ModelQuality", True),
+    ("model_bias", "ModelBias", False),
+    ("model_explainability", "ModelExplainability", False),
+)
+
+# adaptive retries pace requests client-side once SageMaker starts throttling
+_CLIENT_CONFIG = Config(
+    retries={"mode": "adaptive", "max_attempts": 10},
+    connect_timeout=5,
+    read_timeout=60,
+    tcp_keepalive=True,
+    max_pool_connections=50,
+)
+
+
+@functools.lru_cache(maxsize=None)
+def _get_boto_session(region):
+    """Gets the boto3 session shared by all clients and sessions of a region."""
+    return boto3.Session(region_name=region)
+
+
+@functools.lru_cache(maxsize=None)
+def _get_sm_client(region):
+    """Gets the sagemaker client shared by all sessions of a region."""
+    return _get_boto_session(region).client("sagemaker", config=_CLIENT_CONFIG)
+
+
 def get_sagemaker_client(region):
      """Gets the sagemaker client.
 
         Args:
             region: the aws region to start the session
-            default_bucket: the bucket to use for storing the artifacts
 
         Returns:
-            `sagemaker.session.Session instance
+            sagemaker client instance
         """
-     boto_session = boto3.Session(region_name=region)
-     sagemaker_client = boto_session.client("sagemaker")
-     return sagemaker_client
+     return _get_sm_client(region)
+
+
+@functools.lru_cache(maxsize=None)
+def _get_sklearn_image_uri(region, instance_type):
+    """Gets the SageMaker scikit-learn 1.2-1 image URI, memoized per region and instance type.
+
+    Args:
+        region: the aws region of the image repository
+        instance_type: the instance type the image runs on
 
+    Returns:
+        the image URI
+    """
+    return image_uris.retrieve(
+        framework="sklearn",
+        region=region,
+        version="1.2-1",
+        py_version="py3",
+        instance_type=instance_type,
+    )
+
+
+def _use_s3_accelerate_endpoint(session):
+    """Points the S3 client and resource of a session at the S3 Transfer Acceleration endpoint.
+
+    Args:
+        session: the `sagemaker.session.Session` uploading the pipeline artifacts
+
+    Returns:
+        the same session
+    """
+    s3_config = Config(s3={"use_accelerate_endpoint": True})
+    session.s3_client = session.boto_session.client("s3", config=s3_config)
+    session.s3_resource = session.boto_session.resource("s3", config=s3_config)
+    return session
 
-def get_session(region, default_bucket):
+
+def get_session(region, default_bucket, s3_accelerate=False):
     """Gets the sagemaker session based on the region.
 
     Args:
         region: the aws region to start the session
         default_bucket: the bucket to use for storing the artifacts
+        s3_accelerate: whether to upload through S3 Transfer Acceleration, which must be enabled on the bucket
 
     Returns:
         `sagemaker.session.Session instance
     """
 
-    boto_session = boto3.Session(region_name=region)
+    boto_session = _get_boto_session(region)
 
-    sagemaker_client = boto_session.client("sagemaker")
-    runtime_client = boto_session.client("sagemaker-runtime")
-    return sagemaker.session.Session(
+    runtime_client = boto_session.client("sagemaker-runtime", config=_CLIENT_CONFIG)
+    session = sagemaker.session.Session(
         boto_session=boto_session,
-        sagemaker_client=sagemaker_client,
+        sagemaker_client=_get_sm_client(region),
         sagemaker_runtime_client=runtime_client,
         default_bucket=default_bucket,
     )
+    if s3_accelerate:
+        _use_s3_accelerate_endpoint(session)
+    return session
 
 
-def get_pipeline_session(region, default_bucket):
+def get_pipeline_session(region, default_bucket, s3_accelerate=False):
     """Gets the pipeline session based on the region.
 
     Args:
         region: the aws region to start the session
         default_bucket: the bucket to use for storing the artifacts
+        s3_accelerate: whether to upload through S3 Transfer Acceleration, which must be enabled on the bucket
 
     Returns:
         PipelineSession instance
     """
 
-    boto_session = boto3.Session(region_name=region)
-    sagemaker_client = boto_session.client("sagemaker")
-
-    return PipelineSession(
-        boto_session=boto_session,
-        sagemaker_client=sagemaker_client,
+    session = PipelineSession(
+        boto_session=_get_boto_session(region),
+        sagemaker_client=_get_sm_client(region),
         default_bucket=default_bucket,
     )
+    if s3_accelerate:
+        _use_s3_accelerate_endpoint(session)
+    return session
+
+
+def _s3_uri(*parts):
+    """Gets an S3 URI from a bucket and key components.
+
+    Args:
+        parts: the bucket followed by the key components, any of which may be a pipeline variable
+
+    Returns:
+        a `Join` evaluated at execution time if any component is a pipeline variable, else a string
+    """
+    if any(is_pipeline_variable(part) for part in parts):
+        return Join(on="/", values=["s3:/", *parts])
+    return "s3://" + "/".join(str(part).strip("/") for part in parts)
+
+
+def _build_data_config(s3_data_input_path, s3_output_path, s3_analysis_config_output_path):
+    """Gets the Clarify data configuration for the headerless HMDA training data.
+
+    Args:
+        s3_data_input_path: the dataset to analyze
+        s3_output_path: where the Clarify job writes its results
+        s3_analysis_config_output_path: where the analysis configuration is written
+
+    Returns:
+        `sagemaker.clarify.DataConfig` instance
+    """
+    return DataConfig(
+        s3_data_input_path=s3_data_input_path,
+        s3_output_path=s3_output_path,
+        s3_analysis_config_output_path=s3_analysis_config_output_path,
+        label="action_taken",
+        headers=list(_HMDA_HEADERS),
+        dataset_type="text/csv",
+    )
+
+
+@functools.lru_cache(maxsize=32)
+def _fetch_project_tags(region, sagemaker_project_name):
+    """Gets the tags of a SageMaker project, memoized for the lifetime of the process.
+
+    Args:
+        region: the aws region of the project
+        sagemaker_project_name: the name of the project
+
+    Returns:
+        tuple of the project tags
+    """
+    sm_client = get_sagemaker_client(region)
+    response = sm_client.describe_project(ProjectName=sagemaker_project_name)
+    sagemaker_project_arn = response["ProjectArn"]
+    paginator = sm_client.get_paginator("list_tags")
+    return tuple(
+        project_tag
+        for page in paginator.paginate(ResourceArn=sagemaker_project_arn)
+        for project_tag in page["Tags"]
+    )
+
 
 def get_pipeline_custom_tags(new_tags, region, sagemaker_project_name=None):
     try:
-        sm_client = get_sagemaker_client(region)
-        response = sm_client.describe_project(ProjectName=sagemaker_project_name)
-        sagemaker_project_arn = response["ProjectArn"]
-        response = sm_client.list_tags(
-            ResourceArn=sagemaker_project_arn)
-        project_tags = response["Tags"]
-        for project_tag in project_tags:
-            new_tags.append(project_tag)
+        for project_tag in _fetch_project_tags(region, sagemaker_project_name):
+            new_tags.append(dict(project_tag))
     except Exception as e:
         print(f"Error getting project tags: {e}")
     return new_tags
@@ -176,6 +307,8 @@ def get_pipeline(
     processing_instance_type="ml.t3.large",
     training_instance_type="ml.m5.xlarge",
     sagemaker_project_name=None,
+    s3_accelerate=False,
+    use_automl=True,
 ):
     """Gets a SageMaker ML Pipeline instance working with HMDA data.
 
@@ -183,16 +316,19 @@ def get_pipeline(
         region: AWS region to create and run the pipeline.
         role: IAM role to create and run steps and pipeline.
         default_bucket: the bucket to use for storing the artifacts
+        s3_accelerate: whether to upload the step code and configurations through S3 Transfer Acceleration
+        use_automl: whether to train with AutoML or with a single XGBoost training job on `training_instance_type`
 
     Returns:
         an instance of a pipeline
     """
-    sagemaker_session = get_session(region, default_bucket)
-    default_bucket = sagemaker_session.default_bucket()
+    pipeline_session = get_pipeline_session(region, default_bucket, s3_accelerate)
+    default_bucket = pipeline_session.default_bucket()
     if role is None:
-        role = sagemaker.session.get_execution_role(sagemaker_session)
+        role = sagemaker.session.get_execution_role(pipeline_session)
 
-    pipeline_session = get_pipeline_session(region, default_bucket)
+    # steps whose inputs and arguments are unchanged since a previous execution reuse its outputs
+    cache_config = CacheConfig(enable_caching=True, expire_after="P30D")
     
     # parameters for pipeline execution
     processing_instance_count = ParameterInteger(name="ProcessingInstanceCount", default_value=1)
@@ -202,42 +338,36 @@ def get_pipeline(
     input_data = ParameterString(
         name="InputDataUrl",
         #default_value=f"s3://{default_bucket}/dataset_for_monitoring/state_DC_monitoring.csv",        
-        default_value=f"s3://{default_bucket}/dataset/state_DC.csv"
+        default_value=_s3_uri(default_bucket, "dataset", "state_DC.csv")
     )
 
-    # for data quality check step
-    skip_check_data_quality = ParameterBoolean(name="SkipDataQualityCheck", default_value=False)
-    register_new_baseline_data_quality = ParameterBoolean(name="RegisterNewDataQualityBaseline", default_value=False)
-    supplied_baseline_statistics_data_quality = ParameterString(name="DataQualitySuppliedStatistics", default_value='')
-    supplied_baseline_constraints_data_quality = ParameterString(name="DataQualitySuppliedConstraints", default_value='')
-
-    # for data bias check step
-    skip_check_data_bias = ParameterBoolean(name="SkipDataBiasCheck", default_value = False)
-    register_new_baseline_data_bias = ParameterBoolean(name="RegisterNewDataBiasBaseline", default_value=False)
-    supplied_baseline_constraints_data_bias = ParameterString(name="DataBiasSuppliedBaselineConstraints", default_value='')
-
-    # for model quality check step
-    skip_check_model_quality = ParameterBoolean(name="SkipModelQualityCheck", default_value = False)
-    register_new_baseline_model_quality = ParameterBoolean(name="RegisterNewModelQualityBaseline", default_value=False)
-    supplied_baseline_statistics_model_quality = ParameterString(name="ModelQualitySuppliedStatistics", default_value='')
-    supplied_baseline_constraints_model_quality = ParameterString(name="ModelQualitySuppliedConstraints", default_value='')
-
-    # for model bias check step
-    skip_check_model_bias = ParameterBoolean(name="SkipModelBiasCheck", default_value=False)
-    register_new_baseline_model_bias = ParameterBoolean(name="RegisterNewModelBiasBaseline", default_value=False)
-    supplied_baseline_constraints_model_bias = ParameterString(name="ModelBiasSuppliedBaselineConstraints", default_value='')
-
-    # for model explainability check step
-    skip_check_model_explainability = ParameterBoolean(name="SkipModelExplainabilityCheck", default_value=False)
-    register_new_baseline_model_explainability = ParameterBoolean(name="RegisterNewModelExplainabilityBaseline", default_value=False)
-    supplied_baseline_constraints_model_explainability = ParameterString(name="ModelExplainabilitySuppliedBaselineConstraints", default_value='')
+    # skip, register-new-baseline and supplied-baseline parameters for each quality and Clarify check step
+    params = {}
+    for kind, name, uses_statistics in _CHECK_KINDS:
+        params[f"skip_check_{kind}"] = ParameterBoolean(name=f"Skip{name}Check", default_value=False)
+        params[f"register_new_baseline_{kind}"] = ParameterBoolean(
+            name=f"RegisterNew{name}Baseline", default_value=False
+        )
+        if uses_statistics:
+            params[f"supplied_baseline_statistics_{kind}"] = ParameterString(
+                name=f"{name}SuppliedStatistics", default_value=''
+            )
+            params[f"supplied_baseline_constraints_{kind}"] = ParameterString(
+                name=f"{name}SuppliedConstraints", default_value=''
+            )
+        else:
+            params[f"supplied_baseline_constraints_{kind}"] = ParameterString(
+                name=f"{name}SuppliedBaselineConstraints", default_value=''
+            )
 
     # processing step for feature engineering
-    sklearn_processor = SKLearnProcessor(
-        framework_version="1.2-1",
+    # equivalent to `SKLearnProcessor(framework_version="1.2-1", ...)` with the image URI resolved only once
+    sklearn_processor = ScriptProcessor(
+        image_uri=_get_sklearn_image_uri(region, processing_instance_type),
+        command=["python3"],
         instance_type=processing_instance_type,
         instance_count=processing_instance_count,
-        base_job_name=f"{base_job_prefix}/sklearn-hmda-preprocess",
+        base_job_name=f"{base_job_prefix}/sklearn-hmda",
         sagemaker_session=pipeline_session,
         role=role,
     )
@@ -254,9 +384,14 @@ def get_pipeline(
 
     step_process = ProcessingStep(
         name="PreprocessHMDAData",
-        step_args=step_args,        
+        step_args=step_args,
+        cache_config=cache_config,
     )
 
+    train_s3_uri = step_process.properties.ProcessingOutputConfig.Outputs["train"].S3Output.S3Uri
+    train_no_header_s3_uri = step_process.properties.ProcessingOutputConfig.Outputs["train_no_header"].S3Output.S3Uri
+    test_s3_uri = step_process.properties.ProcessingOutputConfig.Outputs["test"].S3Output.S3Uri
+
     ### Calculating the Data Quality
 
     # `CheckJobConfig` is a helper function that's used to define the job configurations used by the `QualityCheckStep`.
@@ -266,29 +401,34 @@ def get_pipeline(
     # the baseline, in this case, the training dataset from the data processing step, the dataset format, in this case,
     # a csv file with no headers, and the output path for the results of the data quality check.
 
+    # All five quality and Clarify checks share this configuration, so they run on the same instance type
+    # as the model and transform instances. Check jobs do not support warm pools.
     check_job_config = CheckJobConfig(
         role=role,
         instance_count=1,
-        instance_type="ml.t3.large",
+        instance_type="ml.m5.xlarge",
         volume_size_in_gb=30,
         sagemaker_session=pipeline_session,
     )
 
     data_quality_check_config = DataQualityCheckConfig(
-        baseline_dataset=step_process.properties.ProcessingOutputConfig.Outputs["train_no_header"].S3Output.S3Uri,
+        baseline_dataset=train_no_header_s3_uri,
         dataset_format=DatasetFormat.csv(header=False, output_columns_position="START"),
-        output_s3_uri=Join(on='/', values=['s3:/', default_bucket, base_job_prefix, ExecutionVariables.PIPELINE_EXECUTION_ID, 'dataqualitycheckstep'])
+        output_s3_uri=_s3_uri(
+            default_bucket, base_job_prefix, ExecutionVariables.PIPELINE_EXECUTION_ID, "dataqualitycheckstep"
+        )
     )
 
     data_quality_check_step = QualityCheckStep(
         name="DataQualityCheckStep",
-        skip_check=skip_check_data_quality,
-        register_new_baseline=register_new_baseline_data_quality,
+        skip_check=params["skip_check_data_quality"],
+        register_new_baseline=params["register_new_baseline_data_quality"],
         quality_check_config=data_quality_check_config,
         check_job_config=check_job_config,
-        supplied_baseline_statistics=supplied_baseline_statistics_data_quality,
-        supplied_baseline_constraints=supplied_baseline_constraints_data_quality,
-        model_package_group_name=model_package_group_name
+        supplied_baseline_statistics=params["supplied_baseline_statistics_data_quality"],
+        supplied_baseline_constraints=params["supplied_baseline_constraints_data_quality"],
+        model_package_group_name=model_package_group_name,
+        cache_config=cache_config,
     )
 
 
@@ -303,101 +443,147 @@ def get_pipeline(
     # More details on `BiasConfig` can be found at
     # https://sagemaker.readthedocs.io/en/stable/api/training/processing.html#sagemaker.clarify.BiasConfig
 
-    data_bias_analysis_cfg_output_path = f"s3://{default_bucket}/{base_job_prefix}/databiascheckstep/analysis_cfg"
+    data_bias_analysis_cfg_output_path = _s3_uri(default_bucket, base_job_prefix, "databiascheckstep", "analysis_cfg")
 
-    data_bias_data_config = DataConfig(
-        s3_data_input_path=step_process.properties.ProcessingOutputConfig.Outputs["train_no_header"].S3Output.S3Uri,
-        s3_output_path=Join(on='/', values=['s3:/', default_bucket, base_job_prefix, ExecutionVariables.PIPELINE_EXECUTION_ID, 'databiascheckstep']),
-        label="action_taken",
-        headers=["action_taken", "conforming_loan_limit", "derived_sex", "preapproval", "loan_type", "loan_purpose",
-        "lien_status", "reverse_mortgage", "open-end_line_of_credit", "business_or_commercial_purpose", "loan_amount",
-        "loan_to_value_ratio", "loan_term", "negative_amortization", "interest_only_payment", "balloon_payment",
-        "other_nonamortizing_features", "property_value", "construction_method", "occupancy_type", "total_units", "income",
-        "debt_to_income_ratio", "derived_age_above_62", "derived_age_below_25", "derived_race_revisited",
-        "if_co-applicant"],
-        dataset_type="text/csv",
+    data_bias_data_config = _build_data_config(
+        s3_data_input_path=train_no_header_s3_uri,
+        s3_output_path=_s3_uri(
+            default_bucket, base_job_prefix, ExecutionVariables.PIPELINE_EXECUTION_ID, "databiascheckstep"
+        ),
         s3_analysis_config_output_path=data_bias_analysis_cfg_output_path,
     )
 
-    # We are using this bias config to configure clarify to detect bias in the features enumerated in the facet_name list 
-    data_bias_config = BiasConfig(
+    # We are using this bias config to configure clarify to detect bias in the features enumerated in the facet_name
+    # list. It is shared by the data bias and the model bias checks.
+    bias_config = BiasConfig(
         label_values_or_threshold=[1], facet_name=["derived_sex", "derived_age_above_62", "derived_age_below_25",
         "derived_race_revisited", "if_co-applicant"]
     )
 
     data_bias_check_config = DataBiasCheckConfig(
         data_config=data_bias_data_config,
-        data_bias_config=data_bias_config,
+        data_bias_config=bias_config,
     )
 
     data_bias_check_step = ClarifyCheckStep(
         name="DataBiasCheckStep",
         clarify_check_config=data_bias_check_config,
         check_job_config=check_job_config,
-        skip_check=skip_check_data_bias,
-        register_new_baseline=register_new_baseline_data_bias,
-        model_package_group_name=model_package_group_name
-    )
-    
-    #### AutoML Step    
-
-    auto_ml = AutoML(
-        role=role, 
-        target_attribute_name="action_taken", 
-        output_kms_key=None,
-        output_path=f"s3://{default_bucket}/{base_job_prefix}/automlstep",
-        base_job_name=f"{base_job_prefix}/automl", 
-        compression_type=None, 
-        sagemaker_session=pipeline_session, 
-        volume_kms_key=None, 
-        encrypt_inter_container_traffic=None, 
-        vpc_config=None, 
-        problem_type="BinaryClassification", 
-        max_candidates=1, 
-        max_runtime_per_training_job_in_seconds=180, 
-        total_job_runtime_in_seconds=540, 
-        job_objective={"MetricName": "F1"}, 
-        generate_candidate_definitions_only=False, 
-        tags=None, 
-        content_type="text/csv;header=present", 
-        s3_data_type="S3Prefix", 
-        feature_specification_s3_uri=None, 
-        validation_fraction=0.2, 
-        mode="ENSEMBLING", 
-        auto_generate_endpoint_name="False", 
-        endpoint_name="hmda_endpoint", 
-        sample_weight_attribute_name=None
-    ) 
-    
-    input_training = AutoMLInput(
-        inputs=step_process.properties.ProcessingOutputConfig.Outputs["train"].S3Output.S3Uri, 
-        target_attribute_name="action_taken", 
-        compression=None, 
-        channel_type="training", 
-        content_type="text/csv;header=present", 
-        s3_data_type="S3Prefix", 
-        sample_weight_attribute_name=None
-    )
-    
-    step_args = auto_ml.fit(
-        inputs=[input_training],
-        wait=True, 
-        logs=True, 
-        job_name=f"{base_job_prefix}/automl-fit"
+        skip_check=params["skip_check_data_bias"],
+        register_new_baseline=params["register_new_baseline_data_bias"],
+        supplied_baseline_constraints=params["supplied_baseline_constraints_data_bias"],
+        model_package_group_name=model_package_group_name,
+        cache_config=cache_config,
     )
     
-    step_automl = AutoMLStep(
-        name="AutoMLStep",
-        step_args=step_args,
-        depends_on=["DataQualityCheckStep", "DataBiasCheckStep"]
-    )
- 
-    best_auto_ml_model = step_automl.get_best_auto_ml_model(
-        sagemaker_session=pipeline_session,
-        role=role
-    )
+    #### Training Step
+
+    # By default the model is trained by AutoML, which searches over algorithms and feature preprocessing for the
+    # best F1 score instead of relying on a fixed model. With `use_automl=False` a single XGBoost training job is run
+    # instead, which is faster when the search is not needed, e.g. while iterating on the other steps.
+
+    # pipeline parameters that only apply to the selected training path
+    training_parameters = []
+    if use_automl:
+        automl_max_candidates = ParameterInteger(name="AutoMLMaxCandidates", default_value=1)
+        training_parameters.append(automl_max_candidates)
+
+        auto_ml = AutoML(
+            role=role,
+            target_attribute_name="action_taken",
+            output_kms_key=None,
+            output_path=_s3_uri(default_bucket, base_job_prefix, "automlstep"),
+            base_job_name=f"{base_job_prefix}/automl",
+            compression_type=None,
+            sagemaker_session=pipeline_session,
+            volume_kms_key=None,
+            encrypt_inter_container_traffic=None,
+            vpc_config=None,
+            problem_type="BinaryClassification",
+            max_candidates=automl_max_candidates,
+            max_runtime_per_training_job_in_seconds=180,
+            total_job_runtime_in_seconds=540,
+            job_objective={"MetricName": "F1"},
+            generate_candidate_definitions_only=False,
+            tags=None,
+            content_type="text/csv;header=present",
+            s3_data_type="S3Prefix",
+            feature_specification_s3_uri=None,
+            validation_fraction=0.2,
+            # AutoMLStep only supports the ENSEMBLING mode
+            mode="ENSEMBLING",
+            auto_generate_endpoint_name="False",
+            endpoint_name="hmda_endpoint",
+            sample_weight_attribute_name=None
+        )
+
+        input_training = AutoMLInput(
+            inputs=train_s3_uri,
+            target_attribute_name="action_taken",
+            compression=None,
+            channel_type="training",
+            content_type="text/csv;header=present",
+            s3_data_type="S3Prefix",
+            sample_weight_attribute_name=None
+        )
+
+        step_args = auto_ml.fit(
+            inputs=[input_training],
+            job_name=f"{base_job_prefix}/automl-fit"
+        )
+
+        step_train = AutoMLStep(
+            name="AutoMLStep",
+            step_args=step_args,
+            cache_config=cache_config,
+        )
+
+        model = step_train.get_best_auto_ml_model(
+            sagemaker_session=pipeline_session,
+            role=role
+        )
+    else:
+        # a single fixed XGBoost training job avoids AutoML's candidate generation and processing jobs;
+        # `binary:hinge` predicts 0/1 labels, as the evaluation and model quality steps expect
+        image_uri = image_uris.retrieve(
+            framework="xgboost",
+            region=region,
+            version="1.7-1",
+            instance_type=training_instance_type,
+        )
+        xgb_train = Estimator(
+            image_uri=image_uri,
+            role=role,
+            instance_type=training_instance_type,
+            instance_count=1,
+            output_path=_s3_uri(default_bucket, base_job_prefix, "trainstep"),
+            base_job_name=f"{base_job_prefix}/xgboost-train",
+            sagemaker_session=pipeline_session,
+        )
+        xgb_train.set_hyperparameters(
+            objective="binary:hinge",
+            eval_metric="error",
+            num_round=100,
+        )
+
+        step_args = xgb_train.fit(
+            inputs={"train": TrainingInput(s3_data=train_no_header_s3_uri, content_type="text/csv")},
+        )
+
+        step_train = TrainingStep(
+            name="TrainHMDA",
+            step_args=step_args,
+            cache_config=cache_config,
+        )
+
+        model = Model(
+            image_uri=image_uri,
+            model_data=step_train.properties.ModelArtifacts.S3ModelArtifacts,
+            sagemaker_session=pipeline_session,
+            role=role,
+        )
 
-    step_args = best_auto_ml_model.create(
+    step_args = model.create(
         instance_type="ml.m5.xlarge"
     )
 
@@ -412,7 +598,7 @@ def get_pipeline(
         instance_count=1,
         accept="text/csv",
         assemble_with="Line",
-        output_path=f"s3://{default_bucket}/HMDATransform",
+        output_path=_s3_uri(default_bucket, base_job_prefix, ExecutionVariables.PIPELINE_EXECUTION_ID, "transform"),
         sagemaker_session=pipeline_session,
     )
 
@@ -420,7 +606,7 @@ def get_pipeline(
     # The output format is `prediction, original label`
 
     transform_inputs = TransformInput(
-        data=step_process.properties.ProcessingOutputConfig.Outputs["test"].S3Output.S3Uri,
+        data=test_s3_uri,
     )
 
     step_args = transformer.transform(
@@ -432,9 +618,15 @@ def get_pipeline(
         split_type="Line",
     )
 
+    # Note: the transform is only served from cache while the model name it is bound to stays the same
+    # between executions; the name produced by `step_create_model` is regenerated on every run.
+    # Its output path is scoped to the execution, so the steps reading the predictions (the model quality
+    # check and the evaluation) get a new cache key on every run instead of reusing results computed on
+    # an earlier execution's predictions.
     step_transform = TransformStep(
         name="HMDATransform",
         step_args=step_args,
+        cache_config=cache_config,
     )
 
     ### Check the Model Quality
@@ -448,7 +640,9 @@ def get_pipeline(
     model_quality_check_config = ModelQualityCheckConfig(
         baseline_dataset=step_transform.properties.TransformOutput.S3OutputPath,
         dataset_format=DatasetFormat.csv(header=False),
-        output_s3_uri=Join(on="/", values=["s3:/", default_bucket, base_job_prefix, ExecutionVariables.PIPELINE_EXECUTION_ID, "modelqualitycheckstep"]),
+        output_s3_uri=_s3_uri(
+            default_bucket, base_job_prefix, ExecutionVariables.PIPELINE_EXECUTION_ID, "modelqualitycheckstep"
+        ),
         problem_type="BinaryClassification",
         inference_attribute="_c1",
         ground_truth_attribute="_c0"
@@ -456,35 +650,30 @@ def get_pipeline(
 
     model_quality_check_step = QualityCheckStep(
         name="ModelQualityCheckStep",
-        skip_check=skip_check_model_quality,
-        register_new_baseline=register_new_baseline_model_quality,
+        skip_check=params["skip_check_model_quality"],
+        register_new_baseline=params["register_new_baseline_model_quality"],
         quality_check_config=model_quality_check_config,
         check_job_config=check_job_config,
-        supplied_baseline_statistics=supplied_baseline_statistics_model_quality,
-        supplied_baseline_constraints=supplied_baseline_constraints_model_quality,
-        model_package_group_name=model_package_group_name
+        supplied_baseline_statistics=params["supplied_baseline_statistics_model_quality"],
+        supplied_baseline_constraints=params["supplied_baseline_constraints_model_quality"],
+        model_package_group_name=model_package_group_name,
+        cache_config=cache_config,
     )
 
     ### Check for Model Bias
     
-    # Similar to the Data Bias check step, a `BiasConfig` is defined and Clarify is used to calculate
+    # Using the same `BiasConfig` as the Data Bias check step, Clarify is used to calculate
     # the model bias using the training dataset and the model.
 
 
-    model_bias_analysis_cfg_output_path = f"s3://{default_bucket}/{base_job_prefix}/modelbiascheckstep/analysis_cfg"
+    model_bias_analysis_cfg_output_path = _s3_uri(default_bucket, base_job_prefix, "modelbiascheckstep", "analysis_cfg")
 
-    model_bias_data_config = DataConfig(
-        s3_data_input_path=step_process.properties.ProcessingOutputConfig.Outputs["train_no_header"].S3Output.S3Uri,
-        s3_output_path=Join(on='/', values=['s3:/', default_bucket, base_job_prefix, ExecutionVariables.PIPELINE_EXECUTION_ID, 'modelbiascheckstep']),
+    model_bias_data_config = _build_data_config(
+        s3_data_input_path=train_no_header_s3_uri,
+        s3_output_path=_s3_uri(
+            default_bucket, base_job_prefix, ExecutionVariables.PIPELINE_EXECUTION_ID, "modelbiascheckstep"
+        ),
         s3_analysis_config_output_path=model_bias_analysis_cfg_output_path,
-        label="action_taken",
-        headers=["action_taken", "conforming_loan_limit", "derived_sex", "preapproval", "loan_type", "loan_purpose",
-        "lien_status", "reverse_mortgage", "open-end_line_of_credit", "business_or_commercial_purpose", "loan_amount",
-        "loan_to_value_ratio", "loan_term", "negative_amortization", "interest_only_payment", "balloon_payment",
-        "other_nonamortizing_features", "property_value", "construction_method", "occupancy_type", "total_units", "income",
-        "debt_to_income_ratio", "derived_age_above_62", "derived_age_below_25", "derived_race_revisited",
-        "if_co-applicant"],
-        dataset_type="text/csv",
     )
     
     model_config = ModelConfig(
@@ -493,15 +682,9 @@ def get_pipeline(
         instance_type='ml.m5.large',
     )
 
-    # We are using this bias config to configure clarify to detect bias in the features enumerated in the facet_name list
-    model_bias_config = BiasConfig(
-        label_values_or_threshold=[1], facet_name=["derived_sex", "derived_age_above_62", "derived_age_below_25",
-        "derived_race_revisited", "if_co-applicant"]
-    )
-
     model_bias_check_config = ModelBiasCheckConfig(
         data_config=model_bias_data_config,
-        data_bias_config=model_bias_config,
+        data_bias_config=bias_config,
         model_config=model_config,
         model_predicted_label_config=ModelPredictedLabelConfig()
     )
@@ -510,10 +693,11 @@ def get_pipeline(
         name="ModelBiasCheckStep",
         clarify_check_config=model_bias_check_config,
         check_job_config=check_job_config,
-        skip_check=skip_check_model_bias,
-        register_new_baseline=register_new_baseline_model_bias,
-        supplied_baseline_constraints=supplied_baseline_constraints_model_bias,
-        model_package_group_name=model_package_group_name
+        skip_check=params["skip_check_model_bias"],
+        register_new_baseline=params["register_new_baseline_model_bias"],
+        supplied_baseline_constraints=params["supplied_baseline_constraints_model_bias"],
+        model_package_group_name=model_package_group_name,
+        cache_config=cache_config,
     )
 
     ### Check Model Explainability
@@ -527,31 +711,27 @@ def get_pipeline(
     # use `SHAPConfig`. For more information of `explainability_config`, visit the Clarify documentation at
     # https://docs.aws.amazon.com/sagemaker/latest/dg/clarify-model-explainability.html.
 
-    model_explainability_analysis_cfg_output_path = "s3://{}/{}/{}/{}".format(
-        default_bucket,
-        base_job_prefix,
-        "modelexplainabilitycheckstep",
-        "analysis_cfg"
+    model_explainability_analysis_cfg_output_path = _s3_uri(
+        default_bucket, base_job_prefix, "modelexplainabilitycheckstep", "analysis_cfg"
     )
 
-    model_explainability_data_config = DataConfig(
-        s3_data_input_path=step_process.properties.ProcessingOutputConfig.Outputs["train_no_header"].S3Output.S3Uri,
-        s3_output_path=Join(on='/', values=['s3:/', default_bucket, base_job_prefix, ExecutionVariables.PIPELINE_EXECUTION_ID, 'modelexplainabilitycheckstep']),
+    model_explainability_data_config = _build_data_config(
+        s3_data_input_path=train_no_header_s3_uri,
+        s3_output_path=_s3_uri(
+            default_bucket, base_job_prefix, ExecutionVariables.PIPELINE_EXECUTION_ID, "modelexplainabilitycheckstep"
+        ),
         s3_analysis_config_output_path=model_explainability_analysis_cfg_output_path,
-        label="action_taken",
-        headers=["action_taken", "conforming_loan_limit", "derived_sex", "preapproval", "loan_type", "loan_purpose",
-        "lien_status", "reverse_mortgage", "open-end_line_of_credit", "business_or_commercial_purpose", "loan_amount",
-        "loan_to_value_ratio", "loan_term", "negative_amortization", "interest_only_payment", "balloon_payment",
-        "other_nonamortizing_features", "property_value", "construction_method", "occupancy_type", "total_units", "income",
-        "debt_to_income_ratio", "derived_age_above_62", "derived_age_below_25", "derived_race_revisited",
-        "if_co-applicant"],
-        dataset_type="text/csv",
     )
     
+    # Kernel SHAP cost grows with `num_samples` times the background rows (`num_clusters`), so both are kept
+    # small; only the aggregated (global) SHAP values are saved
     shap_config = SHAPConfig(
-        seed=123,        
+        seed=123,
         num_samples=26,
-        num_clusters=1
+        num_clusters=1,
+        agg_method="mean_abs",
+        use_logit=False,
+        save_local_shap_values=False,
     )
     
     model_explainability_check_config = ModelExplainabilityCheckConfig(
@@ -563,21 +743,15 @@ def get_pipeline(
         name="ModelExplainabilityCheckStep",
         clarify_check_config=model_explainability_check_config,
         check_job_config=check_job_config,
-        skip_check=skip_check_model_explainability,
-        register_new_baseline=register_new_baseline_model_explainability,
-        supplied_baseline_constraints=supplied_baseline_constraints_model_explainability,
-        model_package_group_name=model_package_group_name
-    )
-    
-    sklearn_processor = SKLearnProcessor(
-        framework_version="1.2-1",
-        instance_type=processing_instance_type,
-        instance_count=processing_instance_count,
-        base_job_name=f"{base_job_prefix}/sklearn-hmda-evaluate",
-        sagemaker_session=pipeline_session,
-        role=role
+        skip_check=params["skip_check_model_explainability"],
+        register_new_baseline=params["register_new_baseline_model_explainability"],
+        supplied_baseline_constraints=params["supplied_baseline_constraints_model_explainability"],
+        model_package_group_name=model_package_group_name,
+        cache_config=cache_config,
     )
     
+    # the preprocessing processor is shared with the evaluation; the pipeline step name identifies the job
+
     step_args = sklearn_processor.run(
         inputs=[
             ProcessingInput(
@@ -604,6 +778,7 @@ def get_pipeline(
         name="EvaluateHMDAModel",
         step_args=step_args,
         property_files=[evaluation_report],
+        cache_config=cache_config,
     )
 
     model_metrics = ModelMetrics(
@@ -702,7 +877,7 @@ def get_pipeline(
     # for drift checks and not register new baselines that are calculated in the Pipeline run.
 
 
-    step_args = best_auto_ml_model.register(
+    step_args = model.register(
         content_types=["text/csv"],
         response_types=["text/csv"],
         inference_instances=["ml.m5.xlarge"],
@@ -738,35 +913,25 @@ def get_pipeline(
     pipeline = Pipeline(
         name=pipeline_name,
         parameters=[
-            processing_instance_type,
             processing_instance_count,
-            training_instance_type,
             model_approval_status,
             input_data,
-
-            skip_check_data_quality,
-            register_new_baseline_data_quality,
-            supplied_baseline_statistics_data_quality,
-            supplied_baseline_constraints_data_quality,
-
-            skip_check_data_bias,
-            register_new_baseline_data_bias,
-            supplied_baseline_constraints_data_bias,
-
-            skip_check_model_quality,
-            register_new_baseline_model_quality,
-            supplied_baseline_statistics_model_quality,
-            supplied_baseline_constraints_model_quality,
-
-            skip_check_model_bias,
-            register_new_baseline_model_bias,
-            supplied_baseline_constraints_model_bias,
-
-            skip_check_model_explainability,
-            register_new_baseline_model_explainability,
-            supplied_baseline_constraints_model_explainability
+            *training_parameters,
+            *params.values(),
+        ],
+        steps=[
+            step_process,
+            data_quality_check_step,
+            data_bias_check_step,
+            step_train,
+            step_create_model,
+            step_transform,
+            model_quality_check_step,
+            model_bias_check_step,
+            model_explainability_check_step,
+            step_eval,
+            step_cond,
         ],
-        steps=[step_process, data_quality_check_step, data_bias_check_step, step_automl, step_create_model, step_transform, model_quality_check_step, model_bias_check_step, model_explainability_check_step, step_eval, step_cond],
         sagemaker_session=pipeline_session,
     )
     return pipeline
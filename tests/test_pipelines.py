@@ -1,3 +1,6 @@
+import json
+
+import mock
 import pytest
 
 
@@ -9,3 +12,71 @@ def test_that_you_wrote_tests():
 def test_pipelines_importable():
     import pipelines  # noqa: F401
 
+
+@pytest.mark.parametrize("use_automl", [True, False])
+def test_pipeline_definition_renders(monkeypatch, use_automl):
+    from pipelines.abalone.pipeline import get_pipeline
+
+    monkeypatch.setenv("AWS_ACCESS_KEY_ID", "testing")
+    monkeypatch.setenv("AWS_SECRET_ACCESS_KEY", "testing")
+    with mock.patch("sagemaker.session.Session.default_bucket", return_value="bucket"), mock.patch(
+        "sagemaker.session.Session.upload_data", return_value="s3://bucket/code/script.py"
+    ), mock.patch(
+        "sagemaker.session.Session.upload_string_as_file_body", return_value="s3://bucket/analysis_config.json"
+    ):
+        pipeline = get_pipeline(
+            region="us-east-1",
+            role="arn:aws:iam::123456789012:role/SageMakerRole",
+            default_bucket="bucket",
+            use_automl=use_automl,
+        )
+        definition = json.loads(pipeline.definition())
+
+    step_names = [step["Name"] for step in definition["Steps"]]
+    assert "PreprocessHMDAData" in step_names
+    assert "HMDATransform" in step_names
+    assert ("AutoMLStep" in step_names) is use_automl
+    parameter_names = [parameter["Name"] for parameter in definition["Parameters"]]
+    assert ("AutoMLMaxCandidates" in parameter_names) is use_automl
+
+
+@pytest.fixture
+def project_tags_client():
+    from pipelines.abalone import pipeline
+
+    client = mock.Mock()
+    client.describe_project.return_value = {"ProjectArn": "arn:aws:sagemaker:us-east-1:123456789012:project/hmda"}
+    client.get_paginator.return_value.paginate.return_value = [
+        {"Tags": [{"Key": "team", "Value": "mlops"}]},
+        {"Tags": [{"Key": "stage", "Value": "dev"}]},
+    ]
+    pipeline._fetch_project_tags.cache_clear()
+    with mock.patch.object(pipeline, "get_sagemaker_client", return_value=client):
+        yield client
+    pipeline._fetch_project_tags.cache_clear()
+
+
+def test_pipeline_custom_tags_are_paginated_and_cached(project_tags_client):
+    from pipelines.abalone.pipeline import get_pipeline_custom_tags
+
+    expected = [{"Key": "team", "Value": "mlops"}, {"Key": "stage", "Value": "dev"}]
+    tags = get_pipeline_custom_tags([], "us-east-1", "hmda")
+    assert tags == expected
+    project_tags_client.get_paginator.assert_called_once_with("list_tags")
+
+    tags[0]["Value"] = "changed"
+    assert get_pipeline_custom_tags([], "us-east-1", "hmda") == expected
+    project_tags_client.describe_project.assert_called_once_with(ProjectName="hmda")
+    project_tags_client.get_paginator.return_value.paginate.assert_called_once()
+
+
+def test_pipeline_custom_tags_failures_are_not_cached(project_tags_client):
+    from pipelines.abalone.pipeline import get_pipeline_custom_tags
+
+    project_tags_client.describe_project.side_effect = [
+        Exception("throttled"),
+        {"ProjectArn": "arn:aws:sagemaker:us-east-1:123456789012:project/hmda"},
+    ]
+    assert get_pipeline_custom_tags([], "us-east-1", "hmda") == []
+    assert len(get_pipeline_custom_tags([], "us-east-1", "hmda")) == 2
+    assert project_tags_client.describe_project.call_count == 2